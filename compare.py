@@ -4,10 +4,15 @@ import numpy as np
 from datetime import datetime
 import os
 
+# 案號未出現在某字典中時使用的分類名稱（保留字，字典中不可使用）
+MISSING_LABEL = '<未分類>'
+
 class CrossAnalyzer:
     def __init__(self, result_dir="status_check_result"):
         self.result_dir = result_dir
         self.available_dicts = self._load_available_dicts()
+        self._cube = None
+        self._cube_signature = None
         
     def _load_available_dicts(self):
         """Load all JSON files from the result directory"""
@@ -83,6 +88,225 @@ class CrossAnalyzer:
         
         return df
     
+    def _source_signature(self):
+        """Return (filename, mtime, size) of every JSON file, used to invalidate the cube"""
+        signature = []
+        for filename in sorted(os.listdir(self.result_dir)):
+            if filename.endswith('.json'):
+                stat = os.stat(os.path.join(self.result_dir, filename))
+                signature.append((filename, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+    
+    def build_cube(self):
+        """
+        Build the multi-dimensional count cube from all category dictionaries in one pass.
+        
+        Every case is assigned its code tuple once (one code per dictionary); a case that
+        is missing from a dictionary gets the extra "missing" code len(categories). Only
+        the non-empty cells are kept, as a code matrix plus a count per cell.
+        
+        The cube counts distinct case numbers: a case listed more than once in the same
+        dictionary is only counted under its first category, whereas create_cross_analysis
+        counts every list entry.
+        
+        Returns:
+            dict: Cube with 'dims', 'categories', 'codes' and 'counts' keys
+        """
+        signature = self._source_signature()
+        dims = [filename.replace('.json', '') for filename, _, _ in signature]
+        
+        # 逐一讀取字典，為每個案號指定各維度的代碼
+        categories = []
+        case_codes = {}
+        for axis, (filename, _, _) in enumerate(signature):
+            data = self._load_json(os.path.join(self.result_dir, filename))
+            if MISSING_LABEL in data:
+                raise ValueError(f"{filename} 使用了保留的分類名稱 {MISSING_LABEL}")
+            categories.append(list(data.keys()))
+            for code, cat in enumerate(categories[axis]):
+                for case in data[cat]:
+                    codes = case_codes.setdefault(case, [None] * len(dims))
+                    # 同一案號在同一字典中重複出現時以第一次為準
+                    if codes[axis] is None:
+                        codes[axis] = code
+        
+        # 未出現在某字典中的案號使用「缺失」代碼
+        missing = [len(cats) for cats in categories]
+        rows = [[missing[axis] if code is None else code for axis, code in enumerate(codes)]
+                for codes in case_codes.values()]
+        code_matrix = np.array(rows, dtype=np.int64).reshape(len(rows), len(dims))
+        
+        # 只保留非空的格子
+        if len(rows):
+            cells, counts = np.unique(code_matrix, axis=0, return_counts=True)
+        else:
+            cells, counts = code_matrix, np.zeros(0, dtype=np.int64)
+        
+        self._cube = {
+            'dims': dims,
+            'categories': categories,
+            'codes': cells,
+            'counts': counts,
+        }
+        self._cube_signature = signature
+        return self._cube
+    
+    def get_cube(self):
+        """Return the cached cube, rebuilding it when the source JSON files have changed"""
+        if self._cube is None or self._cube_signature != self._source_signature():
+            self.build_cube()
+        return self._cube
+    
+    def _resolve_axis(self, cube, dim):
+        """Resolve a dictionary name, filename or menu number to an axis of the given cube"""
+        if dim in self.available_dicts:
+            dim = self.available_dicts[dim]
+        name = dim.replace('.json', '')
+        if name not in cube['dims']:
+            raise ValueError(f"無效的字典: {dim}")
+        return cube['dims'].index(name)
+    
+    def _slice(self, cube, axes):
+        """Sum the cube down to the given axes, keeping the trailing "missing" code"""
+        if len(set(axes)) != len(axes):
+            raise ValueError("字典不可重複選擇")
+        
+        shape = tuple(len(cube['categories'][axis]) + 1 for axis in axes)
+        result = np.zeros(shape, dtype=np.int64)
+        np.add.at(result, tuple(cube['codes'][:, axis] for axis in axes), cube['counts'])
+        return result
+    
+    @staticmethod
+    def _labels(cube, axis):
+        """Return the category labels of an axis, including the trailing missing label"""
+        return cube['categories'][axis] + [MISSING_LABEL]
+    
+    def cube_slice(self, *dims, include_missing=True):
+        """
+        Sum the cube down to the given dictionaries.
+        
+        The last index along each axis counts the cases missing from that dictionary,
+        so every slice sums to the same number of cases and summing a slice over one
+        dictionary gives the slice of the remaining ones.
+        
+        Args:
+            *dims: Dictionary names (e.g. 'status_dict'), filenames or menu numbers
+            include_missing (bool): Keep the missing index; if False, cases missing from
+                any requested dictionary are left out, as in create_cross_analysis
+            
+        Returns:
+            np.ndarray: Count array with one axis per requested dictionary
+        """
+        cube = self.get_cube()
+        axes = [self._resolve_axis(cube, dim) for dim in dims]
+        counts = self._slice(cube, axes)
+        if include_missing:
+            return counts
+        
+        # 去掉每個維度最後的「缺失」代碼
+        return counts[tuple(slice(0, -1) for _ in axes)]
+    
+    def marginal(self, dim):
+        """Return the distinct case count per category of a single dictionary as a Series"""
+        cube = self.get_cube()
+        axis = self._resolve_axis(cube, dim)
+        counts = self._slice(cube, [axis])
+        series = pd.Series(counts, index=self._labels(cube, axis))
+        
+        # 依位置判斷是否保留「未分類」
+        return series if counts[-1] else series.iloc[:-1]
+    
+    def _cross_table(self, cube, axis1, axis2, output_csv):
+        """Build the count table of two axes of the given cube"""
+        counts = self._slice(cube, [axis1, axis2])
+        df = pd.DataFrame(counts, index=self._labels(cube, axis1),
+                          columns=self._labels(cube, axis2))
+        
+        # 只在有案號缺少分類時保留「未分類」行列（依位置判斷）
+        if not counts[-1, :].any():
+            df = df.iloc[:-1, :]
+        if not counts[:, -1].any():
+            df = df.iloc[:, :-1]
+        
+        # 添加總計行和列
+        df['總計'] = df.sum(axis=1)
+        df.loc['總計'] = df.sum(axis=0)
+        df = df.astype(int)
+        print(f"項目總數: {df.at['總計', '總計']}")
+        
+        if output_csv:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            output_filename = (f'cross_analysis_{cube["dims"][axis1]}_vs_'
+                               f'{cube["dims"][axis2]}_{timestamp}.csv')
+            os.makedirs("compare_result", exist_ok=True)
+            output_path = os.path.join("compare_result", output_filename)
+            df.to_csv(output_path, encoding='utf-8-sig')
+            print(f"\n分析結果已保存至: {output_filename}")
+        
+        return df
+    
+    def cube_cross_analysis(self, dim1, dim2, output_csv=True):
+        """
+        Create the count version of create_cross_analysis from the cached cube.
+        
+        Cases missing from a dictionary are counted in a '<未分類>' row or column, so
+        the grand total is the number of distinct cases across all dictionaries
+        (see build_cube).
+        
+        Args:
+            dim1: First dictionary (rows)
+            dim2: Second dictionary (columns)
+            output_csv (bool): Whether to save the table to compare_result
+            
+        Returns:
+            pd.DataFrame: Count table with '總計' row and column
+        """
+        cube = self.get_cube()
+        axis1, axis2 = self._resolve_axis(cube, dim1), self._resolve_axis(cube, dim2)
+        return self._cross_table(cube, axis1, axis2, output_csv)
+    
+    def three_way_analysis(self, dim1, dim2, dim3):
+        """
+        Return a three-way breakdown from the cached cube.
+        
+        Missing cases are kept under '<未分類>', so summing over dim3 gives the
+        cube_cross_analysis table of dim1 and dim2.
+        
+        Returns:
+            pd.DataFrame: Counts indexed by (dim1, dim2) with dim3 categories as columns
+        """
+        cube = self.get_cube()
+        axes = [self._resolve_axis(cube, dim) for dim in (dim1, dim2, dim3)]
+        counts = self._slice(cube, axes)
+        
+        index = pd.MultiIndex.from_product(
+            [self._labels(cube, axes[0]), self._labels(cube, axes[1])],
+            names=[cube['dims'][axes[0]], cube['dims'][axes[1]]])
+        df = pd.DataFrame(counts.reshape(-1, counts.shape[2]), index=index,
+                          columns=self._labels(cube, axes[2]))
+        
+        # 只保留有案件的組合，「未分類」欄依位置判斷是否保留
+        if not counts[:, :, -1].any():
+            df = df.iloc[:, :-1]
+        return df[df.sum(axis=1) > 0]
+    
+    def run_all_pairs(self, output_csv=True):
+        """
+        Run the cross-analysis for every pair of dictionaries from a single cube build.
+        
+        Returns:
+            dict: Mapping of (dict1_name, dict2_name) to the count table
+        """
+        cube = self.get_cube()
+        results = {}
+        for axis1, dim1 in enumerate(cube['dims']):
+            for axis2 in range(axis1 + 1, len(cube['dims'])):
+                dim2 = cube['dims'][axis2]
+                results[(dim1, dim2)] = self._cross_table(cube, axis1, axis2, output_csv)
+        
+        print(f"\n已完成 {len(results)} 組交叉分析")
+        return results
+    
     def run_analysis(self):
         """Run the cross-analysis with user input"""
         # 顯示可用的字典
@@ -91,14 +315,27 @@ class CrossAnalyzer:
             print(f"{key}: {value}")
         
         # 獲取用戶輸入
-        print("\n請選擇要交叉比對的兩個字典（輸入編號）：")
+        print("\n請選擇要交叉比對的兩個字典（輸入編號，輸入 all 產生所有組合）：")
         dict1_num = input("第一個字典編號: ")
+        if dict1_num.strip().lower() == 'all':
+            return self.run_all_pairs(output_csv=True)
         dict2_num = input("第二個字典編號: ")
+        dict3_num = input("第三個字典編號（三向分析，可留空）: ").strip()
         
         # 驗證輸入
         if dict1_num not in self.available_dicts or dict2_num not in self.available_dicts:
             raise ValueError("無效的字典編號")
         
+        # 三向分析由預先計算的資料立方體提供
+        if dict3_num:
+            if dict3_num not in self.available_dicts:
+                raise ValueError("無效的字典編號")
+            pd.set_option('display.max_rows', None)
+            pd.set_option('display.max_columns', None)
+            result_df = self.three_way_analysis(dict1_num, dict2_num, dict3_num)
+            print(result_df)
+            return result_df
+        
         # 獲取文件路徑
         dict1_path = os.path.join(self.result_dir, self.available_dicts[dict1_num])
         dict2_path = os.path.join(self.result_dir, self.available_dicts[dict2_num])
@@ -0,0 +1,303 @@
+import pandas as pd
+import json
+import os
+import re
+from bisect import bisect_left, bisect_right
+
+class PatentHistoryStore:
+    # 用於記錄案件是否出現在該次匯出中的特殊欄位
+    PRESENCE_COLUMN = '__present__'
+    # timeline 中顯示存在標記時使用的欄位名稱
+    PRESENCE_LABEL = '出現於匯出'
+
+    def __init__(self, store_dir="history_result", case_column='公司案號'):
+        """
+        Initialize the PatentHistoryStore.
+
+        Only per-case column changes between successive exports are kept, stored
+        columnar (one list per field) and indexed by case and by snapshot date.
+
+        Args:
+            store_dir (str): Directory where the change log is saved
+            case_column (str): Column holding the case number
+        """
+        self.store_dir = store_dir
+        self.store_path = os.path.join(store_dir, "history.json")
+        self.case_column = case_column
+
+        # 欄式儲存的變更紀錄
+        self.cases = []
+        self.dates = []
+        self.columns = []
+        self.values = []
+
+        # 索引：快照日期與其第一筆變更的位置、各案號的變更位置
+        self.snapshot_dates = []
+        self.snapshot_offsets = []
+        self.case_index = {}
+
+        # 最新快照的案件狀態，用於比對下一次匯出
+        self.current_state = {}
+        self.load()
+
+    @staticmethod
+    def _normalize_date(date):
+        """Convert '20250402', '2025-04-02' or a datetime to 'YYYYMMDD'"""
+        return pd.Timestamp(date).strftime('%Y%m%d')
+
+    @staticmethod
+    def _date_from_filename(csv_path):
+        """Extract the snapshot date from an export filename such as '20250402export.csv'"""
+        match = re.search(r'(\d{8})', os.path.basename(csv_path))
+        if not match:
+            raise ValueError(f"無法從檔名取得日期: {csv_path}")
+        return match.group(1)
+
+    def _append_change(self, case, date, column, value):
+        """Append one change to the columnar log and the case index"""
+        self.case_index.setdefault(case, []).append(len(self.cases))
+        self.cases.append(case)
+        self.dates.append(date)
+        self.columns.append(column)
+        self.values.append(value)
+
+    def _rebuild_indexes(self):
+        """Rebuild the case index and latest state from the columnar log"""
+        self.case_index = {}
+        self.current_state = {}
+        for pos, (case, column, value) in enumerate(zip(self.cases, self.columns, self.values)):
+            self.case_index.setdefault(case, []).append(pos)
+            self.current_state.setdefault(case, {})[column] = value
+
+    def load(self):
+        """
+        Load the change log from the store directory, if it exists.
+
+        Returns:
+            self: Returns the instance for method chaining
+        """
+        if not os.path.exists(self.store_path):
+            return self
+
+        with open(self.store_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        self.cases = data['case']
+        self.dates = data['date']
+        self.columns = data['column']
+        self.values = data['value']
+        self.snapshot_dates = data['snapshot_dates']
+        self.snapshot_offsets = data['snapshot_offsets']
+        self._rebuild_indexes()
+        return self
+
+    def save(self):
+        """
+        Save the change log to the store directory.
+
+        Returns:
+            self: Returns the instance for method chaining
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        data = {
+            'case': self.cases,
+            'date': self.dates,
+            'column': self.columns,
+            'value': self.values,
+            'snapshot_dates': self.snapshot_dates,
+            'snapshot_offsets': self.snapshot_offsets,
+        }
+        with open(self.store_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+        print(f"已保存 {len(self.cases)} 筆變更紀錄到 {self.store_dir} 目錄")
+        return self
+
+    def ingest(self, csv_path, snapshot_date=None):
+        """
+        Ingest an export and record only the columns that changed since the last snapshot.
+
+        Args:
+            csv_path (str): Path to the exported CSV file
+            snapshot_date (str, optional): Snapshot date; taken from the filename if omitted
+
+        Returns:
+            self: Returns the instance for method chaining
+        """
+        date = self._normalize_date(snapshot_date or self._date_from_filename(csv_path))
+        if self.snapshot_dates and date <= self.snapshot_dates[-1]:
+            raise ValueError(f"快照日期 {date} 必須晚於最後一次匯入的 {self.snapshot_dates[-1]}")
+
+        # 全部以字串讀取，確保不同快照之間的比對一致
+        df = pd.read_csv(csv_path, dtype=str)
+        if self.case_column not in df.columns:
+            raise ValueError(f"{os.path.basename(csv_path)} 缺少 {self.case_column} 欄位")
+
+        # 同一快照中案號重複會產生虛假的變更紀錄
+        cases = df[self.case_column].dropna()
+        duplicated = sorted(cases[cases.duplicated()].unique())
+        if duplicated:
+            raise ValueError(f"{os.path.basename(csv_path)} 中案號重複: {', '.join(duplicated)}")
+        df = df.astype(object).where(pd.notna(df), None)
+
+        # 先在區域變數中收集變更，整個檔案處理完畢後才寫入紀錄與索引
+        changes = []
+        updates = {}
+        for record in df.to_dict('records'):
+            case = record.pop(self.case_column)
+            if case is None:
+                continue
+
+            state = updates.setdefault(case, dict(self.current_state.get(case, {})))
+            record[self.PRESENCE_COLUMN] = True
+            for column in list(record) + [c for c in state if c not in record]:
+                value = record.get(column)
+                if state.get(column) != value:
+                    changes.append((case, column, value))
+                    state[column] = value
+
+        # 不在本次匯出中的案件標記為不存在
+        for case, state in self.current_state.items():
+            if case not in updates and state.get(self.PRESENCE_COLUMN):
+                changes.append((case, self.PRESENCE_COLUMN, False))
+                updates[case] = dict(state, **{self.PRESENCE_COLUMN: False})
+
+        self.snapshot_dates.append(date)
+        self.snapshot_offsets.append(len(self.cases))
+        for case, column, value in changes:
+            self._append_change(case, date, column, value)
+        self.current_state.update(updates)
+
+        print(f"已匯入 {os.path.basename(csv_path)} ({date})，新增 {len(self.cases) - self.snapshot_offsets[-1]} 筆變更")
+        return self
+
+    def _end_offset(self, date):
+        """Return the log position just after the last snapshot taken on or before date"""
+        idx = bisect_right(self.snapshot_dates, self._normalize_date(date))
+        if idx == len(self.snapshot_dates):
+            return len(self.cases)
+        return self.snapshot_offsets[idx]
+
+    def get_case_state(self, case_number, date):
+        """
+        Get the state of one case as of the given date.
+
+        Returns:
+            dict: Column values of the case, or None if the case did not exist then
+        """
+        state = self._case_state_until(case_number, self._end_offset(date))
+        if not state.pop(self.PRESENCE_COLUMN, False):
+            return None
+        return {column: value for column, value in state.items() if value is not None}
+
+    def _case_state_until(self, case_number, end):
+        """Replay the changes of one case logged before the given log position"""
+        positions = self.case_index.get(case_number, [])
+        state = {}
+        for pos in positions[:bisect_left(positions, end)]:
+            state[self.columns[pos]] = self.values[pos]
+        return state
+
+    def state_at(self, date):
+        """
+        Get the full portfolio state as of the given date.
+
+        The latest state is returned directly; for earlier dates the log is replayed
+        from whichever end is nearer.
+
+        Returns:
+            pd.DataFrame: One row per existing case, indexed by case number
+        """
+        end = self._end_offset(date)
+
+        if end >= len(self.cases):
+            states = self.current_state
+        elif end <= len(self.cases) - end:
+            # 從頭重播至指定日期
+            states = {}
+            for pos in range(end):
+                states.setdefault(self.cases[pos], {})[self.columns[pos]] = self.values[pos]
+        else:
+            # 從最新狀態回推，只重算指定日期之後有變更的案件
+            states = dict(self.current_state)
+            for case in set(self.cases[end:]):
+                states[case] = self._case_state_until(case, end)
+
+        rows = {case: {column: value for column, value in state.items() if column != self.PRESENCE_COLUMN}
+                for case, state in states.items() if state.get(self.PRESENCE_COLUMN)}
+        df = pd.DataFrame.from_dict(rows, orient='index')
+        df.index.name = self.case_column
+        return df
+
+    def transitions(self, column, date1, date2, from_value=None, to_value=None):
+        """
+        Find the cases whose column value differs between two dates.
+
+        Only the changes logged between the two snapshots are scanned.
+
+        Args:
+            column (str): Column to compare, e.g. '案件狀態'
+            date1: Earlier date
+            date2: Later date
+            from_value (optional): Only keep cases with this value at date1
+            to_value (optional): Only keep cases with this value at date2
+
+        Returns:
+            pd.DataFrame: Case number with the value at each date
+        """
+        if column == self.PRESENCE_COLUMN:
+            raise ValueError(f"{self.PRESENCE_COLUMN} 為內部欄位，請使用 timeline 或 state_at 查詢案件是否存在")
+
+        date1, date2 = self._normalize_date(date1), self._normalize_date(date2)
+        if date1 > date2:
+            raise ValueError(f"起始日期 {date1} 不可晚於結束日期 {date2}")
+
+        start, end = self._end_offset(date1), self._end_offset(date2)
+
+        changed_cases = {self.cases[pos] for pos in range(start, end)
+                         if self.columns[pos] in (column, self.PRESENCE_COLUMN)}
+
+        rows = []
+        for case in sorted(changed_cases):
+            before = self.get_case_state(case, date1) or {}
+            after = self.get_case_state(case, date2) or {}
+            old, new = before.get(column), after.get(column)
+            if old == new:
+                continue
+            if from_value is not None and old != from_value:
+                continue
+            if to_value is not None and new != to_value:
+                continue
+            rows.append({self.case_column: case, 'from': old, 'to': new})
+
+        return pd.DataFrame(rows, columns=[self.case_column, 'from', 'to'])
+
+    def timeline(self, case_number):
+        """
+        Get every recorded change of one case in date order.
+
+        Presence changes are shown under the '出現於匯出' column.
+
+        Returns:
+            pd.DataFrame: Date, column and new value of each change
+        """
+        positions = self.case_index.get(case_number, [])
+        return pd.DataFrame({
+            'date': [self.dates[pos] for pos in positions],
+            'column': [self.PRESENCE_LABEL if self.columns[pos] == self.PRESENCE_COLUMN else self.columns[pos]
+                       for pos in positions],
+            'value': [self.values[pos] for pos in positions],
+        })
+
+
+# Example usage
+if __name__ == "__main__":
+    store = PatentHistoryStore()
+
+    # Ingest successive exports in date order
+    # store.ingest('20250301export.csv').ingest('20250402export.csv').save()
+
+    # Cases moved from 審查中 to 核准 between March and April
+    # print(store.transitions('案件狀態', '20250301', '20250402', from_value='審查中', to_value='核准'))
+    # print(store.timeline('2024-001-T-TW'))